@@ -0,0 +1,151 @@
+"""
+Convert the trained Keras model to ONNX for ONNX Runtime inference,
+and optionally quantize it to INT8.
+
+Run once offline after training (requires tensorflow and tf2onnx):
+
+    python convert_model.py
+
+Add INT8 static quantization (requires onnxruntime), calibrated on a
+directory of ~100 representative lesion images:
+
+    python convert_model.py --quantize --calibration-dir path/to/images
+
+The API loads the ONNX files automatically when they exist (see MODEL_CONFIG).
+"""
+
+import argparse
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent))
+
+from model.config import MODEL_CONFIG, IMAGE_CONFIG, API_CONFIG
+
+
+def convert_to_onnx(model_path: str, output_path: str, opset: int = 17):
+    """
+    Export a Keras .h5 model to ONNX.
+
+    The batch dimension is left dynamic so batched requests can share one call.
+
+    Args:
+        model_path: Path to the trained Keras .h5 model
+        output_path: Destination path for the ONNX model
+        opset: ONNX opset version
+    """
+    import tensorflow as tf
+    import tf2onnx
+
+    print(f"Loading Keras model from {model_path}...")
+    model = tf.keras.models.load_model(model_path)
+
+    input_signature = (
+        tf.TensorSpec((None,) + MODEL_CONFIG["input_shape"], tf.float32, name="input"),
+    )
+
+    print(f"Converting to ONNX (opset {opset})...")
+    tf2onnx.convert.from_keras(
+        model,
+        input_signature=input_signature,
+        opset=opset,
+        output_path=output_path
+    )
+    print(f"ONNX model saved to {output_path}")
+
+
+def quantize_to_int8(model_path: str, output_path: str, calibration_dir: str,
+                     max_images: int = 100):
+    """
+    Apply post-training static INT8 quantization to an ONNX model.
+
+    Weights are quantized per channel to int8 and activations to uint8 (QDQ
+    format), which ONNX Runtime runs with VNNI int8 kernels where available.
+
+    Args:
+        model_path: Path to the FP32 ONNX model
+        output_path: Destination path for the INT8 ONNX model
+        calibration_dir: Directory of representative lesion images
+        max_images: Maximum number of calibration images to use
+    """
+    import tempfile
+    import onnxruntime as ort
+    from onnxruntime.quantization import (
+        CalibrationDataReader, QuantFormat, QuantType, quantize_static
+    )
+    from onnxruntime.quantization.shape_inference import quant_pre_process
+    from model.preprocessor import preprocess_image
+
+    image_paths = sorted(
+        path for path in Path(calibration_dir).iterdir()
+        if path.suffix.lower() in API_CONFIG["allowed_extensions"]
+    )[:max_images]
+    if not image_paths:
+        raise ValueError(f"No calibration images found in {calibration_dir}")
+
+    input_name = ort.InferenceSession(
+        model_path, providers=["CPUExecutionProvider"]
+    ).get_inputs()[0].name
+
+    class LesionCalibrationReader(CalibrationDataReader):
+        """Feeds preprocessed calibration images one at a time."""
+
+        def __init__(self):
+            self._paths = iter(image_paths)
+
+        def get_next(self):
+            path = next(self._paths, None)
+            if path is None:
+                return None
+            image_array = preprocess_image(
+                path.read_bytes(),
+                apply_hair_removal=IMAGE_CONFIG["apply_dull_razor"]
+            )
+            return {input_name: image_array}
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        # Shape inference and graph cleanup recommended before quantization
+        preprocessed_path = str(Path(tmp_dir) / "preprocessed.onnx")
+        quant_pre_process(model_path, preprocessed_path)
+
+        print(f"Calibrating on {len(image_paths)} images...")
+        quantize_static(
+            preprocessed_path,
+            output_path,
+            calibration_data_reader=LesionCalibrationReader(),
+            quant_format=QuantFormat.QDQ,
+            per_channel=True,
+            activation_type=QuantType.QUInt8,
+            weight_type=QuantType.QInt8
+        )
+    print(f"INT8 model saved to {output_path}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert the Keras model to ONNX")
+    parser.add_argument("--model-path", default=MODEL_CONFIG["model_path"])
+    parser.add_argument("--output-path", default=MODEL_CONFIG["onnx_model_path"])
+    parser.add_argument("--opset", type=int, default=17)
+    parser.add_argument("--quantize", action="store_true",
+                        help="Also write an INT8-quantized model")
+    parser.add_argument("--skip-convert", action="store_true",
+                        help="Quantize an existing ONNX model without re-exporting")
+    parser.add_argument("--calibration-dir",
+                        help="Directory of representative images for INT8 calibration")
+    parser.add_argument("--int8-output-path", default=MODEL_CONFIG["onnx_int8_model_path"])
+    parser.add_argument("--max-calibration-images", type=int, default=100)
+    args = parser.parse_args()
+
+    if args.quantize and not args.calibration_dir:
+        parser.error("--quantize requires --calibration-dir")
+
+    if not args.skip_convert:
+        convert_to_onnx(args.model_path, args.output_path, args.opset)
+
+    if args.quantize:
+        quantize_to_int8(
+            args.output_path,
+            args.int8_output_path,
+            args.calibration_dir,
+            args.max_calibration_images
+        )
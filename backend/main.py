@@ -5,23 +5,26 @@ clinical definitions, and triage system.
 
 Production features (optional):
 - Rate limiting (requires slowapi)
-- Automatic image cleanup
+- In-memory image processing (no temporary files)
 - Security headers (CSP, HTTPS)
 - Error monitoring (requires sentry-sdk)
 """
 
 from fastapi import FastAPI, File, UploadFile, HTTPException, Form, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, ORJSONResponse
 from pydantic import BaseModel
-from typing import Dict, List, Optional, Union
+from typing import Dict, Optional, Tuple, Union
+from dataclasses import dataclass
 import os
+import re
 import sys
-import tempfile
-import atexit
+import asyncio
+import anyio.from_thread
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 from pathlib import Path
 from PIL import Image
-import io
+import numpy as np
 
 # Optional: Rate limiting (install slowapi if needed)
 try:
@@ -45,10 +48,31 @@ except ImportError:
 # Add the model directory to the path
 sys.path.append(str(Path(__file__).parent))
 
-from model import config, preprocessor, model_loader, get_model, MODEL_CONFIG, CLASS_LABELS
+from model import config, preprocessor, model_loader, get_model, MODEL_CONFIG, CLASS_LABELS, BatchScheduler
+from model.shared_inference import SharedInferenceClient, parse_address, require_authkey
+
+# Upload validation constants (computed once instead of per request)
+_ALLOWED_EXTS = frozenset(ext.lstrip('.').lower() for ext in config.API_CONFIG["allowed_extensions"])
+_ALLOWED_EXT_RE = re.compile(
+    r"\.(?:%s)$" % "|".join(re.escape(ext) for ext in sorted(_ALLOWED_EXTS)),
+    re.IGNORECASE
+)
+_MAX_FILE_SIZE = config.API_CONFIG["max_file_size"]
+_LESION_LOCATIONS = frozenset(config.LESION_LOCATIONS)
+
+# Startup-time checks, cached so requests avoid env lookups and stat() syscalls
+_SENTRY_ENABLED = SENTRY_AVAILABLE and bool(os.getenv("SENTRY_DSN"))
+# Filled in at startup from the model actually loaded (see _record_model_status)
+_model_loaded = False
+_MODEL_INFO = {
+    "model_type": "EfficientNetB0",
+    "input_shape": "224x224x3",
+    "preprocessing": "Dull-Razor + Normalization",
+    "using_placeholder": "true"
+}
 
 # Initialize Sentry (optional - set SENTRY_DSN env var to enable)
-if SENTRY_AVAILABLE and os.getenv("SENTRY_DSN"):
+if _SENTRY_ENABLED:
     sentry_sdk.init(
         dsn=os.getenv("SENTRY_DSN"),
         integrations=[FastApiIntegration()],
@@ -65,7 +89,8 @@ if RATE_LIMITING_AVAILABLE:
 app = FastAPI(
     title="Skin Disease Diagnosis API",
     description="Medical diagnostic API using EfficientNetB0 for skin disease classification with research paper features",
-    version="2.0.0"
+    version="2.0.0",
+    default_response_class=ORJSONResponse
 )
 
 # Add rate limiter to app state (if available)
@@ -73,19 +98,58 @@ if RATE_LIMITING_AVAILABLE:
     app.state.limiter = limiter
     app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
 
-# Temporary file cleanup on shutdown
-temp_files = []
+# Model inference runs off the event loop on a single worker thread, which keeps
+# Keras/ONNX Runtime calls serialized (parallel instances just contend for cache)
+INFERENCE_POOL = ThreadPoolExecutor(max_workers=1, thread_name_prefix="inference")
+
+# Dynamic batching of concurrent predictions
+scheduler = BatchScheduler(executor=INFERENCE_POOL)
+
+# Optional: shared-memory inference server (set INFERENCE_SERVER_ADDRESS to enable).
+# Workers then preprocess into shared memory and the server owns the only model copy.
+inference_client: Optional[SharedInferenceClient] = None
+
 
-def cleanup_temp_files():
-    """Clean up temporary image files on shutdown"""
-    for file_path in temp_files:
-        try:
-            if os.path.exists(file_path):
-                os.remove(file_path)
-        except Exception as e:
-            print(f"Error cleaning up {file_path}: {e}")
+def _warm_up_model():
+    """Load the model and run one dummy forward pass"""
+    model = get_model()
+    model.predict(np.zeros((1,) + MODEL_CONFIG["input_shape"], dtype=np.float32), verbose=0)
 
-atexit.register(cleanup_temp_files)
+
+def _record_model_status(using_placeholder: bool):
+    """Report the loaded model in /health and /predict responses"""
+    global _model_loaded
+    _model_loaded = not using_placeholder
+    _MODEL_INFO["using_placeholder"] = "true" if using_placeholder else "false"
+
+
+@app.on_event("startup")
+async def warm_up_model():
+    """Load and warm up the model at startup instead of on the first request"""
+    global inference_client
+    
+    if config.INFERENCE_SERVER_CONFIG["address"]:
+        require_authkey(config.INFERENCE_SERVER_CONFIG["authkey"])
+        inference_client = SharedInferenceClient(
+            parse_address(config.INFERENCE_SERVER_CONFIG["address"]),
+            config.INFERENCE_SERVER_CONFIG["authkey"]
+        )
+        _record_model_status(inference_client.using_placeholder)
+        return
+    
+    # Runs on the inference thread so the TensorFlow import/graph load never blocks the loop
+    await asyncio.get_running_loop().run_in_executor(INFERENCE_POOL, _warm_up_model)
+    _record_model_status(model_loader.using_placeholder_model())
+    scheduler.start()
+
+
+@app.on_event("shutdown")
+async def stop_scheduler():
+    """Stop the batching task and inference thread on shutdown"""
+    await scheduler.stop()
+    INFERENCE_POOL.shutdown(wait=False)
+    if inference_client is not None:
+        inference_client.close()
 
 # Configure CORS for Next.js frontend
 allowed_origins = os.getenv("ALLOWED_ORIGINS", "*").split(",")
@@ -120,15 +184,19 @@ async def add_security_headers(request: Request, call_next):
 
 
 # Response models
-class ClinicalDetails(BaseModel):
+# /predict schemas are plain slotted dataclasses: the endpoint returns the
+# dict-shaped result straight to orjson, so they only document the schema
+@dataclass(slots=True, frozen=True)
+class ClinicalDetails:
     """Clinical information about the disease"""
     name: str
     definition: str
-    characteristics: List[str]
+    characteristics: Tuple[str, ...]
     severity: str
 
 
-class TriageInfo(BaseModel):
+@dataclass(slots=True, frozen=True)
+class TriageInfo:
     """Triage information for human-in-the-loop"""
     level: str
     message: str
@@ -136,13 +204,15 @@ class TriageInfo(BaseModel):
     melanoma_probability: float
 
 
-class PatientMetadata(BaseModel):
+@dataclass(slots=True, frozen=True)
+class PatientMetadata:
     """Patient metadata"""
     age: Optional[int]
     lesion_location: Optional[str]
 
 
-class PredictionResponse(BaseModel):
+@dataclass(slots=True, frozen=True)
+class PredictionResponse:
     """Enhanced response model for prediction endpoint"""
     predicted_class: str
     confidence: float
@@ -153,7 +223,8 @@ class PredictionResponse(BaseModel):
     model_info: Dict[str, str]
 
 
-class LowConfidenceResponse(BaseModel):
+@dataclass(slots=True, frozen=True)
+class LowConfidenceResponse:
     """Response model for low confidence predictions"""
     status: str
     confidence: float
@@ -194,12 +265,18 @@ async def root():
 @app.get("/health", response_model=HealthResponse)
 async def health_check():
     """Health check endpoint"""
-    model_path = MODEL_CONFIG["model_path"]
-    model_loaded = os.path.exists(model_path)
+    healthy = True
+    if inference_client is not None:
+        if inference_client.closed:
+            await asyncio.get_running_loop().run_in_executor(None, inference_client.reconnect)
+        healthy = not inference_client.closed
+        if healthy:
+            # The server may have come back with a different model
+            _record_model_status(inference_client.using_placeholder)
     
-    return {
-        "status": "healthy",
-        "model_loaded": model_loaded,
+    body = {
+        "status": "healthy" if healthy else "unhealthy",
+        "model_loaded": _model_loaded and healthy,
         "available_classes": CLASS_LABELS,
         "features": [
             "Dull-Razor hair artifact removal",
@@ -208,40 +285,48 @@ async def health_check():
             "Triage system"
         ]
     }
+    if not healthy:
+        return JSONResponse(status_code=503, content=body)
+    return body
 
 
-async def validate_uploaded_image(file: UploadFile) -> bytes:
+def validate_uploaded_image(file: UploadFile) -> Image.Image:
     """
     Fast image validation with essential checks only.
+    
+    Only the image header is parsed here; the returned lazily-opened image
+    reads straight from the spooled upload file and is decoded once, during
+    preprocessing, so the upload bytes are never copied into Python memory.
     """
     # Validate file extension
     if not file.filename:
         raise HTTPException(status_code=400, detail="No filename provided")
     
-    file_ext = file.filename.split(".")[-1].lower()
-    # Check both with and without dot for compatibility
-    allowed_exts = {ext.lstrip('.') for ext in config.API_CONFIG["allowed_extensions"]}
-    if file_ext not in allowed_exts:
+    if not _ALLOWED_EXT_RE.search(file.filename):
         raise HTTPException(
             status_code=400,
-            detail=f"Invalid file type. Allowed: {', '.join(allowed_exts)}"
+            detail=f"Invalid file type. Allowed: {', '.join(sorted(_ALLOWED_EXTS))}"
         )
     
-    # Read file content
-    content = await file.read()
+    # Validate file size before touching the content
+    upload = file.file
+    size = file.size
+    if size is None:
+        size = upload.seek(0, os.SEEK_END)
     
-    # Validate file size
-    if len(content) > config.API_CONFIG["max_file_size"]:
+    if size > _MAX_FILE_SIZE:
         raise HTTPException(
             status_code=413,
-            detail=f"File too large. Maximum size: {config.API_CONFIG['max_file_size'] / (1024*1024)}MB"
+            detail=f"File too large. Maximum size: {_MAX_FILE_SIZE / (1024*1024)}MB"
         )
     
     # Quick image validation (single pass)
+    upload.seek(0)
     try:
-        image = Image.open(io.BytesIO(content))
-        # Check minimum resolution
-        if image.width < 100 or image.height < 100:
+        image = Image.open(upload)
+        # Check minimum resolution (header only, no pixel decode)
+        width, height = image.size
+        if width < 100 or height < 100:
             raise HTTPException(
                 status_code=400,
                 detail="Image resolution too low. Minimum required: 100x100 pixels"
@@ -254,11 +339,50 @@ async def validate_uploaded_image(file: UploadFile) -> bytes:
             detail=f"Invalid or corrupted image file"
         )
     
-    return content
+    return image
 
 
-@app.post("/predict", response_model=Union[PredictionResponse, LowConfidenceResponse])
-async def predict_disease(
+# The response models only document the schema here: the prediction dict is built
+# by our own code, so it is returned as-is instead of being re-validated per request
+def predict_with_inference_server(image: Image.Image, age: Optional[int],
+                                  lesion_location: Optional[str]) -> dict:
+    """
+    Preprocess straight into a shared memory slot and predict on the inference server.
+    """
+    try:
+        slot = inference_client.acquire_slot()
+    except RuntimeError:
+        raise HTTPException(status_code=503, detail="Server busy, please retry")
+    
+    try:
+        preprocessor.preprocess_image(
+            image,
+            apply_hair_removal=config.IMAGE_CONFIG["apply_dull_razor"],
+            out=inference_client.input_buffer(slot)
+        )
+        future = inference_client.submit(slot)
+    except ConnectionError:
+        inference_client.release_slot(slot)
+        raise HTTPException(status_code=503, detail="Inference server unavailable, please retry")
+    except Exception:
+        # Never submitted, so no reply will hand the slot back
+        inference_client.release_slot(slot)
+        raise
+    
+    # The slot is handed back by the client once the reply (or disconnect) arrives
+    try:
+        probabilities = future.result(timeout=config.INFERENCE_SERVER_CONFIG["request_timeout_s"])
+    except (FutureTimeoutError, ConnectionError):
+        raise HTTPException(status_code=503, detail="Inference server unavailable, please retry")
+    return model_loader.postprocess_batch(probabilities[np.newaxis], [(age, lesion_location)])[0]
+
+
+@app.post(
+    "/predict",
+    response_model=None,
+    responses={200: {"model": Union[PredictionResponse, LowConfidenceResponse]}}
+)
+def predict_disease(
     request: Request,
     file: UploadFile = File(...),
     age: Optional[int] = Form(None),
@@ -276,20 +400,16 @@ async def predict_disease(
     - Low confidence handling
     
     Note: Rate limiting (10 req/min) is active if slowapi is installed.
+    
+    Declared with plain `def` so Starlette runs it on its threadpool: upload
+    reading, decoding and preprocessing never block the event loop.
     """
-    temp_file_path = None
     try:
         # Enhanced validation
-        image_bytes = await validate_uploaded_image(file)
+        image = validate_uploaded_image(file)
         
-        # Save to temporary file for processing
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.png') as tmp:
-            tmp.write(image_bytes)
-            temp_file_path = tmp.name
-            temp_files.append(temp_file_path)
-    
         # Validate lesion location if provided
-        if lesion_location and lesion_location not in config.LESION_LOCATIONS:
+        if lesion_location and lesion_location not in _LESION_LOCATIONS:
             raise HTTPException(
                 status_code=400,
                 detail=f"Invalid lesion location. Allowed locations: {', '.join(config.LESION_LOCATIONS)}"
@@ -302,56 +422,49 @@ async def predict_disease(
                 detail="Age must be between 0 and 150"
             )
         
-        # Preprocess and predict
-        preprocessed_image = preprocessor.preprocess_image(
-            image_bytes,
-            apply_hair_removal=config.IMAGE_CONFIG["apply_dull_razor"]
-        )
-        
-        # Get prediction with metadata
-        result = model_loader.predict(
-            preprocessed_image,
-            patient_age=age,
-            lesion_location=lesion_location
-        )
+        if inference_client is not None:
+            # Multi-worker deployment: inference happens in the shared inference process
+            result = predict_with_inference_server(image, age, lesion_location)
+        else:
+            # Preprocess and predict
+            preprocessed_image = preprocessor.preprocess_image(
+                image,
+                apply_hair_removal=config.IMAGE_CONFIG["apply_dull_razor"]
+            )
+            
+            # Get prediction with metadata (batched with concurrent requests);
+            # the scheduler lives on the event loop, so submit from this worker thread
+            result = anyio.from_thread.run(
+                scheduler.submit,
+                preprocessed_image,
+                age,
+                lesion_location
+            )
         
         # Low confidence handling
         if result["confidence"] < 0.30:
-            return {
+            return ORJSONResponse({
                 "status": "low_confidence",
                 "confidence": result["confidence"],
                 "message": "Unable to make reliable prediction. Image quality may be insufficient.",
                 "suggestion": "Please upload a clearer, higher-resolution image of the lesion.",
                 "class_probabilities": result["class_probabilities"],
                 "patient_metadata": result.get("patient_metadata", {})
-            }
+            })
         # Add model info
-        model_path = MODEL_CONFIG["model_path"]
-        result["model_info"] = {
-            "model_type": "EfficientNetB0",
-            "input_shape": "224x224x3",
-            "preprocessing": "Dull-Razor + Normalization",
-            "using_placeholder": "true" if not os.path.exists(model_path) else "false"
-        }
+        result["model_info"] = _MODEL_INFO
         
-        return result
+        return ORJSONResponse(result)
         
+    except HTTPException:
+        raise
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         # Log to Sentry if configured
-        if SENTRY_AVAILABLE and os.getenv("SENTRY_DSN"):
+        if _SENTRY_ENABLED:
             sentry_sdk.capture_exception(e)
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
-    finally:
-        # Automatic cleanup of temporary file
-        if temp_file_path and os.path.exists(temp_file_path):
-            try:
-                os.remove(temp_file_path)
-                if temp_file_path in temp_files:
-                    temp_files.remove(temp_file_path)
-            except Exception as cleanup_error:
-                print(f"Error cleaning up temp file: {cleanup_error}")
 
 
 @app.exception_handler(Exception)
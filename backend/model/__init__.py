@@ -6,11 +6,13 @@ Contains model loading, preprocessing, and configuration utilities.
 from .model_loader import get_model, load_model
 from .preprocessor import preprocess_image
 from .config import MODEL_CONFIG, CLASS_LABELS
+from .batch_scheduler import BatchScheduler
 
 __all__ = [
     'get_model',
     'load_model',
     'preprocess_image',
     'MODEL_CONFIG',
-    'CLASS_LABELS'
+    'CLASS_LABELS',
+    'BatchScheduler'
 ]
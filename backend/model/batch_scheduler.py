@@ -0,0 +1,116 @@
+"""
+Dynamic request batching for model inference.
+Coalesces concurrent prediction requests into a single batched model.predict call.
+"""
+
+import asyncio
+import threading
+import numpy as np
+from concurrent.futures import Executor
+from typing import List, Optional, Tuple
+from .config import BATCH_CONFIG
+from .model_loader import get_model, postprocess_batch
+
+
+# Pending request: (preprocessed image, patient age, lesion location, result future)
+PendingRequest = Tuple[np.ndarray, Optional[int], Optional[str], asyncio.Future]
+
+
+class BatchScheduler:
+    """
+    Async micro-batching scheduler.
+
+    Requests are queued by submit() and drained by a background task, which
+    waits until either max_batch_size requests are pending or max_latency_ms
+    has elapsed since the first one arrived, then runs one batched prediction.
+    The prediction runs on the given executor so the event loop stays free
+    to accept uploads and send responses meanwhile.
+    """
+
+    def __init__(self, max_batch_size: int = BATCH_CONFIG["max_batch_size"],
+                 max_latency_ms: float = BATCH_CONFIG["max_latency_ms"],
+                 executor: Optional[Executor] = None):
+        self.max_batch_size = max_batch_size
+        self.max_latency_ms = max_latency_ms
+        self._executor = executor
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        # Keras models are not thread-safe; serialize batched predictions
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Start the background batching task on the running event loop."""
+        if self._worker is None or self._worker.done():
+            self._queue = asyncio.Queue()
+            self._worker = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        """Cancel the background batching task."""
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+
+    async def submit(self, image_array: np.ndarray, patient_age: Optional[int] = None,
+                     lesion_location: Optional[str] = None) -> dict:
+        """
+        Queue a preprocessed image for batched prediction.
+
+        Args:
+            image_array: Preprocessed image array of shape (1, 224, 224, 3)
+            patient_age: Optional patient age
+            lesion_location: Optional lesion location on body
+
+        Returns:
+            Prediction dictionary, as returned by model_loader.predict
+        """
+        self.start()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((image_array, patient_age, lesion_location, future))
+        return await future
+
+    async def _run(self):
+        """Drain the queue into batches until cancelled."""
+        loop = asyncio.get_running_loop()
+
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_latency_ms / 1000.0
+
+            # Collect more requests until the batch is full or the deadline passes
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            try:
+                results = await loop.run_in_executor(self._executor, self._predict_batch, batch)
+            except Exception as e:
+                for *_, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            for result, (*_, future) in zip(results, batch):
+                # Skip requests cancelled while waiting (e.g. client disconnected)
+                if not future.done():
+                    future.set_result(result)
+
+    def _predict_batch(self, batch: List[PendingRequest]) -> List[dict]:
+        """Run one batched prediction (on the executor) and build each result."""
+        images = np.concatenate([item[0] for item in batch], axis=0)
+
+        with self._lock:
+            predictions = get_model().predict(images, verbose=0)
+
+        return postprocess_batch(
+            predictions,
+            [(patient_age, lesion_location) for _, patient_age, lesion_location, _ in batch]
+        )
@@ -9,6 +9,8 @@ import os
 MODEL_CONFIG = {
     "input_shape": (224, 224, 3),
     "model_path": os.getenv("MODEL_PATH", "model/skin_disease_model.h5"),
+    "onnx_model_path": os.getenv("ONNX_MODEL_PATH", "model/skin_disease_model.onnx"),
+    "onnx_int8_model_path": os.getenv("ONNX_INT8_MODEL_PATH", "model/skin_disease_model_int8.onnx"),
     "num_classes": 4,
 }
 
@@ -72,9 +74,27 @@ TRIAGE_CONFIG = {
 # Image preprocessing configuration
 IMAGE_CONFIG = {
     "target_size": (224, 224),
+    "working_size": (448, 448),     # Box images are shrunk to before Dull-Razor (its params are tuned for it)
     "color_mode": "rgb",
     "normalization_range": (0, 1),  # Normalize pixel values to [0, 1]
     "apply_dull_razor": True,       # Apply hair artifact removal
+    "dull_razor_kernel_size": 17,   # Black hat structuring element size (pixels)
+    "dull_razor_threshold": 10,     # Black hat response above which a pixel is hair
+    "dull_razor_inpaint_radius": 10,  # Maximum neighbourhood searched when inpainting
+}
+
+# Dynamic batching configuration for concurrent /predict requests
+BATCH_CONFIG = {
+    "max_batch_size": 16,   # Maximum images fused into one model.predict call
+    "max_latency_ms": 20,   # Maximum time a request waits for the batch to fill
+}
+
+# Shared-memory inference server for multi-worker deployments (see model/shared_inference.py)
+INFERENCE_SERVER_CONFIG = {
+    "address": os.getenv("INFERENCE_SERVER_ADDRESS"),  # Loopback "host:port" or Unix socket; unset disables
+    "authkey": os.getenv("INFERENCE_SERVER_AUTHKEY", "").encode() or None,  # Required, no default
+    "slots_per_worker": 32,  # Shared input/output slots allocated by each API worker
+    "request_timeout_s": 30,  # Maximum wait for a reply before answering 503
 }
 
 # API configuration
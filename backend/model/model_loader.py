@@ -3,14 +3,41 @@ Model loading and management utilities.
 """
 
 import os
+import hashlib
 import numpy as np
-from typing import Optional
-from .config import MODEL_CONFIG, CLASS_LABELS
+from typing import List, Optional, Sequence, Tuple
+from .config import MODEL_CONFIG, CLASS_LABELS, CLINICAL_DEFINITIONS, TRIAGE_CONFIG
 
 
 # Global model instance (singleton pattern)
 _model = None
 
+# Class labels as an immutable tuple for building per-request probability dicts
+_CLASS_LABELS_TUPLE = tuple(CLASS_LABELS)
+
+# Clinical details response fragment per class, built once at import.
+# The same dict is shared by every response for that class (treated as read-only).
+_CLINICAL_CACHE = {
+    label: {
+        "name": CLINICAL_DEFINITIONS.get(label, {}).get("name", label),
+        "definition": CLINICAL_DEFINITIONS.get(label, {}).get("definition", "No definition available"),
+        "characteristics": tuple(CLINICAL_DEFINITIONS.get(label, {}).get("characteristics", ())),
+        "severity": CLINICAL_DEFINITIONS.get(label, {}).get("severity", "Unknown")
+    }
+    for label in CLASS_LABELS
+}
+
+# Column of the melanoma probability (drives the triage level)
+_MELANOMA_IDX = _CLASS_LABELS_TUPLE.index("Melanoma") if "Melanoma" in _CLASS_LABELS_TUPLE else None
+
+# Triage levels in priority order: (level, message, requires_immediate_attention)
+_TRIAGE_LEVELS = (
+    ("CRITICAL", "URGENT: Flagged for immediate human review - High melanoma probability detected", True),
+    ("HIGH", "High priority: Recommend professional dermatologist consultation", True),
+    ("MEDIUM", "Moderate priority: Consider professional consultation", False),
+    ("LOW", "Low priority: Monitor condition and consult if symptoms persist", False),
+)
+
 
 class PlaceholderModel:
     """
@@ -32,32 +59,97 @@ class PlaceholderModel:
         batch_size = x.shape[0]
         num_classes = MODEL_CONFIG["num_classes"]
         
-        predictions = []
+        # Draw Gamma(1) (i.e. exponential) variates per sample; normalizing them
+        # row-wise below is equivalent to sampling Dirichlet(1, ..., 1)
+        samples = np.empty((batch_size, num_classes), dtype=np.float64)
         for i in range(batch_size):
             # Use image content to generate deterministic seed
-            # Hash the image array to get consistent results for same image
-            image_hash = hash(x[i].tobytes())
-            
-            # Use the hash as seed for reproducible random numbers
-            rng = np.random.RandomState(seed=abs(image_hash) % (2**31))
-            
-            # Generate deterministic probabilities that sum to 1
-            pred = rng.dirichlet(np.ones(num_classes))
-            predictions.append(pred)
+            # Hash the image buffer in place (no tobytes() copy); unlike hash(),
+            # blake2b is stable across processes and restarts.
+            # Seeding per sample keeps each image's prediction independent of
+            # which other requests it was batched with.
+            digest = hashlib.blake2b(np.ascontiguousarray(x[i]), digest_size=8).digest()
+            rng = np.random.default_rng(int.from_bytes(digest, "little"))
+            rng.standard_exponential(out=samples[i])
         
-        return np.array(predictions, dtype=np.float32)
+        # Generate deterministic probabilities that sum to 1 (one vectorized pass)
+        samples /= samples.sum(axis=1, keepdims=True)
+        
+        return samples.astype(np.float32)
+
+
+class OnnxModel:
+    """
+    ONNX Runtime session for the exported EfficientNetB0 model.
+    Exposes the same predict() interface as a Keras model.
+    """
+    
+    def __init__(self, model_path: str):
+        # Import onnxruntime only when needed
+        import onnxruntime as ort
+        
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.intra_op_num_threads = max(1, (os.cpu_count() or 2) // 2)
+        
+        self.session = ort.InferenceSession(
+            model_path,
+            sess_options=options,
+            providers=["CPUExecutionProvider"]
+        )
+        self.input_name = self.session.get_inputs()[0].name
+    
+    def predict(self, x: np.ndarray, verbose: int = 0) -> np.ndarray:
+        """
+        Run inference on a batch of preprocessed images.
+        
+        Args:
+            x: Input array of shape (batch_size, 224, 224, 3)
+            verbose: Unused, kept for Keras compatibility
+            
+        Returns:
+            Predictions array of shape (batch_size, num_classes)
+        """
+        return self.session.run(None, {self.input_name: x.astype(np.float32, copy=False)})[0]
+
+
+def using_placeholder_model() -> bool:
+    """
+    Check whether the loaded model is the placeholder (loads it if needed).
+    
+    A model file on disk is not enough: it may fail to load, or its runtime
+    (e.g. onnxruntime) may be missing, in which case the placeholder is used.
+    
+    Returns:
+        True if predictions come from the placeholder model
+    """
+    return isinstance(get_model(), PlaceholderModel)
 
 
 def load_model():
     """
     Load the EfficientNetB0 model from disk.
-    Falls back to placeholder model if .h5 file not found.
+    Prefers the INT8-quantized ONNX export, then the FP32 ONNX export,
+    then the Keras .h5 file, and falls back to placeholder model if none is found.
     
     Returns:
-        Loaded Keras model or PlaceholderModel instance
+        Loaded OnnxModel, Keras model or PlaceholderModel instance
     """
     model_path = MODEL_CONFIG["model_path"]
     
+    for onnx_model_path in (MODEL_CONFIG["onnx_int8_model_path"], MODEL_CONFIG["onnx_model_path"]):
+        if not os.path.exists(onnx_model_path):
+            continue
+        try:
+            print(f"Loading ONNX model from {onnx_model_path}...")
+            model = OnnxModel(onnx_model_path)
+            print("ONNX model loaded successfully!")
+            return model
+            
+        except Exception as e:
+            print(f"Error loading ONNX model: {e}")
+            print("Falling back to next available model...")
+    
     if os.path.exists(model_path):
         try:
             # Import tensorflow only when needed
@@ -108,67 +200,82 @@ def predict(image_array: np.ndarray, patient_age: Optional[int] = None,
     Returns:
         Dictionary with predicted class, confidence, clinical details, and triage level
     """
-    from .config import CLINICAL_DEFINITIONS, TRIAGE_CONFIG
-    
     model = get_model()
     
     # Get predictions
     predictions = model.predict(image_array, verbose=0)
     
-    # Get the predicted class index and confidence
-    predicted_class_idx = int(np.argmax(predictions[0]))
-    confidence = float(predictions[0][predicted_class_idx])
+    return postprocess_batch(predictions, [(patient_age, lesion_location)])[0]
+
+
+def postprocess_batch(predictions: np.ndarray,
+                      metadata: Sequence[Tuple[Optional[int], Optional[str]]]) -> List[dict]:
+    """
+    Build prediction results for a batch of samples.
+    
+    Argmax, confidence and triage level are computed column-wise over the
+    whole (batch_size, num_classes) matrix; only the final dict assembly
+    runs per sample.
     
-    # Get class label
-    predicted_class = CLASS_LABELS[predicted_class_idx]
+    Args:
+        predictions: Model output of shape (batch_size, num_classes)
+        metadata: (patient_age, lesion_location) for each sample, in batch order
+        
+    Returns:
+        List of dictionaries with predicted class, confidence, clinical details,
+        and triage level, one per sample
+    """
+    # float64 so threshold comparisons match Python float semantics
+    predictions = np.asarray(predictions, dtype=np.float64)
+    batch_size = predictions.shape[0]
     
-    # Get all class probabilities
-    class_probabilities = {
-        CLASS_LABELS[i]: float(predictions[0][i])
-        for i in range(len(CLASS_LABELS))
-    }
+    # Get the predicted class indices and confidences
+    predicted_class_indices = predictions.argmax(axis=1)
+    confidences = predictions.max(axis=1)
     
-    # Calculate triage level (human-in-the-loop for melanoma)
-    melanoma_confidence = class_probabilities.get("Melanoma", 0.0)
-    
-    if melanoma_confidence >= TRIAGE_CONFIG["melanoma_threshold_critical"]:
-        triage_level = "CRITICAL"
-        triage_message = "URGENT: Flagged for immediate human review - High melanoma probability detected"
-        requires_immediate_attention = True
-    elif melanoma_confidence >= TRIAGE_CONFIG["melanoma_threshold_high"]:
-        triage_level = "HIGH"
-        triage_message = "High priority: Recommend professional dermatologist consultation"
-        requires_immediate_attention = True
-    elif confidence >= TRIAGE_CONFIG["general_threshold_high"]:
-        triage_level = "MEDIUM"
-        triage_message = "Moderate priority: Consider professional consultation"
-        requires_immediate_attention = False
+    # Calculate triage levels (human-in-the-loop for melanoma)
+    if _MELANOMA_IDX is not None:
+        melanoma_probabilities = predictions[:, _MELANOMA_IDX]
     else:
-        triage_level = "LOW"
-        triage_message = "Low priority: Monitor condition and consult if symptoms persist"
-        requires_immediate_attention = False
-    
-    # Get clinical definition for predicted disease
-    clinical_info = CLINICAL_DEFINITIONS.get(predicted_class, {})
-    
-    return {
-        "predicted_class": predicted_class,
-        "confidence": confidence,
-        "class_probabilities": class_probabilities,
-        "clinical_details": {
-            "name": clinical_info.get("name", predicted_class),
-            "definition": clinical_info.get("definition", "No definition available"),
-            "characteristics": clinical_info.get("characteristics", []),
-            "severity": clinical_info.get("severity", "Unknown")
-        },
-        "triage": {
-            "level": triage_level,
-            "message": triage_message,
-            "requires_immediate_attention": requires_immediate_attention,
-            "melanoma_probability": melanoma_confidence
-        },
-        "patient_metadata": {
-            "age": patient_age,
-            "lesion_location": lesion_location
-        }
-    }
+        melanoma_probabilities = np.zeros(batch_size)
+    
+    triage_indices = np.select(
+        [
+            melanoma_probabilities >= TRIAGE_CONFIG["melanoma_threshold_critical"],
+            melanoma_probabilities >= TRIAGE_CONFIG["melanoma_threshold_high"],
+            confidences >= TRIAGE_CONFIG["general_threshold_high"],
+        ],
+        [0, 1, 2],
+        default=3
+    )
+    
+    # Convert each column to Python values once
+    rows = predictions.tolist()
+    predicted_class_indices = predicted_class_indices.tolist()
+    confidences = confidences.tolist()
+    melanoma_probabilities = melanoma_probabilities.tolist()
+    triage_indices = triage_indices.tolist()
+    
+    results = []
+    for i, (patient_age, lesion_location) in enumerate(metadata):
+        predicted_class = _CLASS_LABELS_TUPLE[predicted_class_indices[i]]
+        triage_level, triage_message, requires_immediate_attention = _TRIAGE_LEVELS[triage_indices[i]]
+        
+        results.append({
+            "predicted_class": predicted_class,
+            "confidence": confidences[i],
+            "class_probabilities": dict(zip(_CLASS_LABELS_TUPLE, rows[i])),
+            "clinical_details": _CLINICAL_CACHE[predicted_class],
+            "triage": {
+                "level": triage_level,
+                "message": triage_message,
+                "requires_immediate_attention": requires_immediate_attention,
+                "melanoma_probability": melanoma_probabilities[i]
+            },
+            "patient_metadata": {
+                "age": patient_age,
+                "lesion_location": lesion_location
+            }
+        })
+    
+    return results
@@ -6,36 +6,133 @@ Implements preprocessing pipeline from research paper including Dull-Razor algor
 import numpy as np
 from PIL import Image
 from io import BytesIO
+from typing import Optional, Union
 from .config import IMAGE_CONFIG
 
+# Optional: Numba JIT kernels (install numba if needed)
+try:
+    import numba
+    # /predict preprocesses on many threadpool threads at once, and numba's fallback
+    # workqueue layer aborts the process on concurrent parallel kernels; require TBB
+    # or OpenMP so a host without either fails at import (kernel warm-up) instead
+    numba.config.THREADING_LAYER = "threadsafe"
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+    print("Warning: numba not installed. Falling back to NumPy preprocessing.")
+
+# Optional: OpenCV morphology for Dull-Razor (install opencv-python-headless if needed)
+try:
+    import cv2
+    OPENCV_AVAILABLE = True
+except ImportError:
+    OPENCV_AVAILABLE = False
+
+DULL_RAZOR_AVAILABLE = NUMBA_AVAILABLE and OPENCV_AVAILABLE
+if not DULL_RAZOR_AVAILABLE:
+    print("Warning: opencv/numba not installed. Dull-Razor hair removal disabled.")
+
+
+if NUMBA_AVAILABLE:
+    @numba.njit(cache=True, fastmath=True)
+    def _to_float_norm(u8_in, out):
+        """Rescale a flat uint8 buffer to float32 in [0, 1] in a single pass."""
+        scale = np.float32(1.0 / 255.0)
+        for i in range(u8_in.shape[0]):
+            out[i] = u8_in[i] * scale
+    
+    @numba.njit(parallel=True, cache=True)
+    def _dullrazor_inpaint(rgb, mask, out, max_radius):
+        """
+        Fill masked (hair) pixels with the mean of their nearest unmasked neighbours.
+        
+        For each masked pixel the search window grows one ring at a time until it
+        contains at least one unmasked pixel or max_radius is reached, in which case
+        the original pixel is kept.
+        """
+        height, width, _ = rgb.shape
+        
+        for y in numba.prange(height):
+            for x in range(width):
+                out[y, x, 0] = rgb[y, x, 0]
+                out[y, x, 1] = rgb[y, x, 1]
+                out[y, x, 2] = rgb[y, x, 2]
+                if mask[y, x] == 0:
+                    continue
+                
+                for radius in range(1, max_radius + 1):
+                    y0, y1 = max(y - radius, 0), min(y + radius + 1, height)
+                    x0, x1 = max(x - radius, 0), min(x + radius + 1, width)
+                    count = 0
+                    r_sum = 0.0
+                    g_sum = 0.0
+                    b_sum = 0.0
+                    for yy in range(y0, y1):
+                        for xx in range(x0, x1):
+                            if mask[yy, xx] == 0:
+                                r_sum += rgb[yy, xx, 0]
+                                g_sum += rgb[yy, xx, 1]
+                                b_sum += rgb[yy, xx, 2]
+                                count += 1
+                    if count > 0:
+                        out[y, x, 0] = np.uint8(r_sum / count + 0.5)
+                        out[y, x, 1] = np.uint8(g_sum / count + 0.5)
+                        out[y, x, 2] = np.uint8(b_sum / count + 0.5)
+                        break
+    
+    # Warm up at import so the first request does not pay the JIT/cache-load cost
+    _to_float_norm(np.zeros(3, dtype=np.uint8), np.empty(3, dtype=np.float32))
+    _dullrazor_inpaint(
+        np.zeros((2, 2, 3), dtype=np.uint8),
+        np.zeros((2, 2), dtype=np.uint8),
+        np.empty((2, 2, 3), dtype=np.uint8),
+        1
+    )
+
 
 def apply_dull_razor(image: Image.Image) -> Image.Image:
     """
-    Dull-Razor algorithm placeholder for hair artifact removal.
+    Dull-Razor algorithm for hair artifact removal.
     
-    This is a placeholder implementation acknowledging the hair artifact removal
-    step mentioned in the research paper. In production, this would implement
-    the actual Dull-Razor algorithm for removing hair from dermoscopic images.
+    Steps:
+    1. Grayscale conversion
+    2. Black hat morphological operation to detect dark hair
+    3. Binary thresholding to create hair mask
+    4. Inpainting to fill hair regions (Numba kernel)
+    
+    Falls back to returning the original image if opencv/numba are not installed.
     
     Args:
-        image: PIL Image object
+        image: PIL Image object in RGB mode
         
     Returns:
-        Processed image with hair artifacts removed (currently returns original)
+        Processed image with hair artifacts removed
     """
-    # PLACEHOLDER: Actual Dull-Razor implementation would go here
-    # The algorithm typically involves:
-    # 1. Grayscale conversion
-    # 2. Black hat morphological operation to detect dark hair
-    # 3. Binary thresholding to create hair mask
-    # 4. Inpainting to fill hair regions
+    if not DULL_RAZOR_AVAILABLE:
+        return image
+    
+    rgb = np.asarray(image, dtype=np.uint8)
     
-    # For now, return the original image
-    # TODO: Implement actual Dull-Razor algorithm when needed
-    return image
+    # Step 1: Grayscale conversion
+    gray = cv2.cvtColor(rgb, cv2.COLOR_RGB2GRAY)
+    
+    # Step 2: Black hat highlights thin dark structures (hair) on lighter skin
+    kernel_size = IMAGE_CONFIG["dull_razor_kernel_size"]
+    kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (kernel_size, kernel_size))
+    blackhat = cv2.morphologyEx(gray, cv2.MORPH_BLACKHAT, kernel)
+    
+    # Step 3: Threshold into a binary hair mask
+    _, mask = cv2.threshold(blackhat, IMAGE_CONFIG["dull_razor_threshold"], 255, cv2.THRESH_BINARY)
+    
+    # Step 4: Inpaint hair pixels from their surroundings
+    out = np.empty_like(rgb)
+    _dullrazor_inpaint(rgb, mask, out, IMAGE_CONFIG["dull_razor_inpaint_radius"])
+    
+    return Image.fromarray(out)
 
 
-def preprocess_image(image_bytes: bytes, apply_hair_removal: bool = True) -> np.ndarray:
+def preprocess_image(image: Union[bytes, Image.Image], apply_hair_removal: bool = True,
+                     out: Optional[np.ndarray] = None) -> np.ndarray:
     """
     Preprocess image for model prediction according to research paper specifications.
     
@@ -45,16 +142,27 @@ def preprocess_image(image_bytes: bytes, apply_hair_removal: bool = True) -> np.
     3. Normalize pixel values to [0, 1] range
     
     Args:
-        image_bytes: Raw image bytes from uploaded file
+        image: Raw image bytes from uploaded file, or an already-opened PIL Image
+            (e.g. from upload validation) to avoid parsing it a second time
         apply_hair_removal: Whether to apply Dull-Razor algorithm (default: True)
+        out: Optional C-contiguous float32 array of shape (1, 224, 224, 3) to write
+            into (e.g. a shared memory slot); a new array is allocated if omitted
         
     Returns:
-        Preprocessed image array ready for model input
+        Preprocessed image array ready for model input (out, if given)
         Shape: (1, 224, 224, 3) with values normalized to [0, 1]
     """
     try:
-        # Open image from bytes
-        image = Image.open(BytesIO(image_bytes))
+        target_size = IMAGE_CONFIG["target_size"]  # (224, 224)
+        
+        # Open image from bytes unless the caller already opened it
+        if not isinstance(image, Image.Image):
+            image = Image.open(BytesIO(image))
+        
+        # Bring every format to the same working resolution (2x the target, which keeps
+        # headroom for the final resize) so Dull-Razor's fixed kernel sees hair at one
+        # scale. thumbnail() lets libjpeg-turbo decode JPEGs at a reduced scale first.
+        image.thumbnail(IMAGE_CONFIG["working_size"], Image.Resampling.BILINEAR)
         
         # Convert to RGB if necessary (handles RGBA, grayscale, etc.)
         if image.mode != 'RGB':
@@ -64,18 +172,22 @@ def preprocess_image(image_bytes: bytes, apply_hair_removal: bool = True) -> np.
         if apply_hair_removal:
             image = apply_dull_razor(image)
         
-        # Step 2: Resize to 224×224 pixels (research paper specification)
-        target_size = IMAGE_CONFIG["target_size"]  # (224, 224)
-        image = image.resize(target_size, Image.Resampling.LANCZOS)
-        
-        # Step 3: Convert to numpy array
-        image_array = np.array(image, dtype=np.float32)
+        # Step 2: Resize to 224×224 pixels (research paper specification).
+        # Bilinear matches Keras' default training-time resize and is much cheaper than Lanczos
+        image = image.resize(target_size, Image.Resampling.BILINEAR)
         
-        # Step 4: Normalize pixel values to [0, 1] range (research paper specification)
-        image_array = image_array / 255.0
+        # Step 3: View the resized pixels as a uint8 array
+        pixels = np.asarray(image, dtype=np.uint8)
         
-        # Add batch dimension: (224, 224, 3) -> (1, 224, 224, 3)
-        image_array = np.expand_dims(image_array, axis=0)
+        # Step 4: Normalize pixel values to [0, 1] range (research paper specification),
+        # writing straight into the batched (1, 224, 224, 3) float32 buffer in one pass.
+        # Unless the caller provides one, a fresh buffer per request: it may sit in
+        # the batch queue while other requests are preprocessed, so it must not be shared.
+        image_array = out if out is not None else np.empty((1,) + pixels.shape, dtype=np.float32)
+        if NUMBA_AVAILABLE:
+            _to_float_norm(pixels.ravel(), image_array.ravel())
+        else:
+            np.multiply(pixels, np.float32(1.0 / 255.0), out=image_array[0])
         
         return image_array
         
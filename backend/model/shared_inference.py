@@ -0,0 +1,416 @@
+"""
+Shared-memory inference server for multi-worker deployments.
+
+With `uvicorn --workers N` every worker would otherwise load its own copy of
+the model. Instead, a single inference process owns the model and batches
+requests from all API workers:
+
+- Each API worker allocates a ring of input/output slots in shared memory and
+  preprocesses images straight into a free input slot.
+- Only the slot index travels over a multiprocessing.connection pipe; the
+  inference process reads the tensor in place, runs one batched prediction,
+  writes the probabilities into the matching output slot and replies.
+
+Start the inference process from the backend directory:
+
+    INFERENCE_SERVER_ADDRESS=127.0.0.1:6100 INFERENCE_SERVER_AUTHKEY=<secret> \
+        python -m model.shared_inference
+
+and run the API workers with the same INFERENCE_SERVER_ADDRESS and
+INFERENCE_SERVER_AUTHKEY.
+
+Security: multiprocessing.connection unpickles every message once the authkey
+handshake succeeds, so anyone holding the authkey who can reach the address can
+run code in either process. Keep the address on loopback or a Unix socket and
+the authkey secret; there is deliberately no default authkey.
+"""
+
+import os
+import queue
+import socket
+import threading
+import time
+import numpy as np
+from concurrent.futures import Future
+from multiprocessing import resource_tracker
+from multiprocessing.connection import (
+    Client, Connection, Listener, answer_challenge, deliver_challenge
+)
+from multiprocessing.shared_memory import SharedMemory
+from typing import Dict, List, Optional, Tuple, Union
+from .config import MODEL_CONFIG, BATCH_CONFIG, INFERENCE_SERVER_CONFIG
+from .model_loader import get_model, using_placeholder_model
+
+
+Address = Union[str, Tuple[str, int]]
+
+
+def require_authkey(authkey: Optional[bytes]) -> bytes:
+    """
+    Return the configured authkey, refusing to run without one.
+
+    Raises:
+        RuntimeError: If INFERENCE_SERVER_AUTHKEY is not set
+    """
+    if not authkey:
+        raise RuntimeError(
+            "INFERENCE_SERVER_AUTHKEY must be set to a private secret to use the inference server"
+        )
+    return authkey
+
+
+def parse_address(address: str) -> Address:
+    """
+    Parse an inference server address.
+
+    Args:
+        address: "host:port" for TCP, anything else is treated as a Unix socket path
+
+    Returns:
+        Address accepted by multiprocessing.connection
+    """
+    host, sep, port = address.rpartition(":")
+    if sep and port.isdigit():
+        return host, int(port)
+    return address
+
+
+class _SlotRing:
+    """Input and output tensors for a fixed number of slots, backed by shared memory."""
+
+    def __init__(self, slots: int, input_name: Optional[str] = None,
+                 output_name: Optional[str] = None):
+        self.slots = slots
+        input_shape = (slots,) + MODEL_CONFIG["input_shape"]
+        output_shape = (slots, MODEL_CONFIG["num_classes"])
+        create = input_name is None
+
+        self.input_shm = self._open(input_name, int(np.prod(input_shape)) * 4, create)
+        self.output_shm = self._open(output_name, int(np.prod(output_shape)) * 4, create)
+        self.inputs = np.ndarray(input_shape, dtype=np.float32, buffer=self.input_shm.buf)
+        self.outputs = np.ndarray(output_shape, dtype=np.float32, buffer=self.output_shm.buf)
+
+    @staticmethod
+    def _open(name: str, size: int, create: bool) -> SharedMemory:
+        if create:
+            return SharedMemory(create=True, size=size)
+        shm = SharedMemory(name=name)
+        # The creating API worker owns (and unlinks) the segment; stop this
+        # process's resource tracker from unlinking it on exit
+        resource_tracker.unregister(shm._name, "shared_memory")
+        return shm
+
+    def close(self, unlink: bool = False):
+        # Drop the array views first, otherwise the buffers cannot be released
+        self.inputs = self.outputs = None
+        for shm in (self.input_shm, self.output_shm):
+            try:
+                shm.close()
+                if unlink:
+                    shm.unlink()
+            except (BufferError, FileNotFoundError):
+                pass
+
+
+class SharedInferenceClient:
+    """
+    API-worker side of the shared-memory inference server.
+
+    Usage per request:
+        slot = client.acquire_slot()
+        preprocess_image(image, out=client.input_buffer(slot))
+        probabilities = client.submit(slot).result()
+
+    A slot is returned to the pool once its reply has been received (or its
+    request failed because the server went away), or by release_slot() if it
+    is never submitted. Once the connection is lost the client is closed until
+    reconnect() succeeds; submit() tries that first and raises ConnectionError
+    if the server is still unreachable.
+    
+    using_placeholder reports whether the server is serving the placeholder model.
+    """
+
+    def __init__(self, address: Address, authkey: bytes,
+                 slots: int = INFERENCE_SERVER_CONFIG["slots_per_worker"]):
+        self._address = address
+        self._authkey = require_authkey(authkey)
+        self._ring = _SlotRing(slots)
+        self._free_slots = queue.SimpleQueue()
+        for slot in range(slots):
+            self._free_slots.put(slot)
+        self._pending: Dict[int, Future] = {}
+        self._send_lock = threading.Lock()
+        # Guards _pending and closed so no request is registered after the
+        # reader thread has failed the in-flight ones and exited
+        self._state_lock = threading.Lock()
+        self._connect_lock = threading.Lock()
+        self._shut_down = False
+        self.closed = True
+        self._connect()
+
+    def _connect(self):
+        """Connect, announce the slot ring and start reading replies."""
+        conn = Client(self._address, authkey=self._authkey)
+        try:
+            conn.send((self._ring.input_shm.name, self._ring.output_shm.name, self._ring.slots))
+            self.using_placeholder: bool = conn.recv()
+        except BaseException:
+            conn.close()
+            raise
+        
+        with self._send_lock:
+            self._conn = conn
+        self._reader = threading.Thread(
+            target=self._read_replies, args=(conn,), name="inference-client", daemon=True
+        )
+        with self._state_lock:
+            self.closed = False
+        self._reader.start()
+
+    def reconnect(self) -> bool:
+        """
+        Reconnect after the server went away, reusing the same slot ring.
+
+        Returns:
+            True if the client is connected
+        """
+        with self._connect_lock:
+            if not self.closed:
+                return True
+            if self._shut_down:
+                return False
+            try:
+                self._connect()
+            except Exception as e:
+                print(f"Inference server reconnect failed: {e!r}")
+                return False
+            print("Reconnected to inference server")
+            return True
+
+    def acquire_slot(self) -> int:
+        """
+        Reserve a free slot.
+
+        Raises:
+            RuntimeError: If every slot is in use
+        """
+        try:
+            return self._free_slots.get_nowait()
+        except queue.Empty:
+            raise RuntimeError("All shared memory inference slots are busy")
+
+    def release_slot(self, slot: int):
+        """Return a slot that was acquired but never submitted."""
+        self._free_slots.put(slot)
+
+    def input_buffer(self, slot: int) -> np.ndarray:
+        """Shared input tensor of shape (1, 224, 224, 3) for the given slot."""
+        return self._ring.inputs[slot:slot + 1]
+
+    def submit(self, slot: int) -> Future:
+        """
+        Send a filled slot to the inference server.
+
+        Returns:
+            Future resolving to the probabilities array of shape (num_classes,)
+            
+        Raises:
+            ConnectionError: If the connection to the server is lost; the slot
+                is then still owned by the caller
+        """
+        if self.closed and not self.reconnect():
+            raise ConnectionError("Inference server disconnected")
+        
+        future = Future()
+        with self._state_lock:
+            if self.closed:
+                raise ConnectionError("Inference server disconnected")
+            self._pending[slot] = future
+        
+        try:
+            with self._send_lock:
+                self._conn.send(slot)
+        except (OSError, ValueError):
+            with self._state_lock:
+                self._pending.pop(slot, None)
+            raise ConnectionError("Inference server disconnected")
+        return future
+
+    def _read_replies(self, conn: Connection):
+        """Resolve pending futures as replies arrive (runs on a background thread)."""
+        while True:
+            try:
+                slot, error = conn.recv()
+            except (EOFError, OSError):
+                break
+
+            with self._state_lock:
+                future = self._pending.pop(slot, None)
+            if future is None:
+                # Out of sync with the server; no later reply can be trusted
+                print(f"Inference server protocol error: reply for unknown slot {slot!r}")
+                break
+
+            if error is None:
+                future.set_result(self._ring.outputs[slot].copy())
+            else:
+                future.set_exception(RuntimeError(f"Inference server error: {error}"))
+            self._free_slots.put(slot)
+
+        # Connection lost: refuse new requests and fail whatever is still in flight
+        conn.close()
+        with self._state_lock:
+            self.closed = True
+            failed = list(self._pending.items())
+            self._pending.clear()
+        for slot, future in failed:
+            future.set_exception(ConnectionError("Inference server disconnected"))
+            self._free_slots.put(slot)
+
+    def close(self):
+        """Disconnect from the server and free the shared memory."""
+        with self._connect_lock:
+            self._shut_down = True
+            conn, reader = self._conn, self._reader
+        
+        # Closing the connection does not wake a recv() blocked on the reader thread;
+        # shutting the socket down does. Skipped if the reader already closed it.
+        try:
+            with socket.socket(fileno=os.dup(conn.fileno())) as sock:
+                sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        
+        # The reader writes replies out of the ring, so only release it once it has exited
+        reader.join()
+        self._ring.close(unlink=True)
+
+
+class _WorkerConnection:
+    """Inference-server side of one API worker connection."""
+
+    def __init__(self, conn: Connection, using_placeholder: bool):
+        self.conn = conn
+        input_name, output_name, slots = conn.recv()
+        self.ring = _SlotRing(slots, input_name, output_name)
+        conn.send(using_placeholder)
+        self.send_lock = threading.Lock()
+
+    def reply(self, slot: int, error: Optional[str] = None):
+        try:
+            with self.send_lock:
+                self.conn.send((slot, error))
+        except OSError:
+            # Worker went away; nothing left to notify
+            pass
+
+
+def _receive_requests(worker: _WorkerConnection, requests: queue.Queue):
+    """Forward slot indices from one API worker to the batching loop."""
+    try:
+        while True:
+            requests.put((worker, worker.conn.recv()))
+    except (EOFError, OSError):
+        pass
+    finally:
+        worker.conn.close()
+        # Queued after the worker's last request, so the batching loop
+        # releases its shared memory once nothing else refers to it
+        requests.put((worker, None))
+
+
+def _batch_loop(requests: queue.Queue, max_batch_size: int, max_latency_ms: float):
+    """Fuse requests from all workers into batched predictions."""
+    model = get_model()
+
+    while True:
+        items = [requests.get()]
+        deadline = time.monotonic() + max_latency_ms / 1000.0
+
+        # Collect more requests until the batch is full or the deadline passes
+        while len(items) < max_batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                items.append(requests.get(timeout=timeout))
+            except queue.Empty:
+                break
+
+        batch: List[Tuple[_WorkerConnection, int]] = [item for item in items if item[1] is not None]
+        disconnected = [worker for worker, slot in items if slot is None]
+
+        if batch:
+            try:
+                images = np.stack([worker.ring.inputs[slot] for worker, slot in batch])
+                predictions = model.predict(images, verbose=0)
+            except Exception as e:
+                for worker, slot in batch:
+                    worker.reply(slot, str(e))
+            else:
+                for i, (worker, slot) in enumerate(batch):
+                    worker.ring.outputs[slot] = predictions[i]
+                    worker.reply(slot)
+
+        for worker in disconnected:
+            worker.ring.close()
+
+
+def serve(address: Address, authkey: bytes,
+          max_batch_size: int = BATCH_CONFIG["max_batch_size"],
+          max_latency_ms: float = BATCH_CONFIG["max_latency_ms"]):
+    """
+    Run the inference server until interrupted.
+
+    Args:
+        address: Address to listen on
+        authkey: Shared secret API workers must present
+        max_batch_size: Maximum images fused into one prediction
+        max_latency_ms: Maximum time a request waits for the batch to fill
+    """
+    authkey = require_authkey(authkey)
+    
+    # Load and warm up the model before accepting workers
+    model = get_model()
+    model.predict(np.zeros((1,) + MODEL_CONFIG["input_shape"], dtype=np.float32), verbose=0)
+    using_placeholder = using_placeholder_model()
+
+    requests = queue.Queue()
+    threading.Thread(
+        target=_batch_loop,
+        args=(requests, max_batch_size, max_latency_ms),
+        name="inference-batcher",
+        daemon=True
+    ).start()
+
+    # Authenticate by hand rather than via Listener(authkey=...), so a client with
+    # the wrong key or a bad handshake is closed and dropped instead of raising
+    # out of accept() and taking the only model process down with it
+    with Listener(address) as listener:
+        print(f"Inference server listening on {listener.address}")
+        while True:
+            try:
+                conn = listener.accept()
+            except OSError as e:
+                print(f"Failed to accept inference client: {e}")
+                continue
+            
+            try:
+                deliver_challenge(conn, authkey)
+                answer_challenge(conn, authkey)
+                worker = _WorkerConnection(conn, using_placeholder)
+            except Exception as e:
+                print(f"Rejected inference client: {e!r}")
+                conn.close()
+                continue
+            threading.Thread(target=_receive_requests, args=(worker, requests), daemon=True).start()
+
+
+if __name__ == "__main__":
+    if not INFERENCE_SERVER_CONFIG["address"]:
+        raise SystemExit("Set INFERENCE_SERVER_ADDRESS (e.g. 127.0.0.1:6100) to run the inference server")
+
+    if not INFERENCE_SERVER_CONFIG["authkey"]:
+        raise SystemExit("Set INFERENCE_SERVER_AUTHKEY to a private secret to run the inference server")
+
+    serve(parse_address(INFERENCE_SERVER_CONFIG["address"]), INFERENCE_SERVER_CONFIG["authkey"])